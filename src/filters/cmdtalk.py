@@ -32,12 +32,67 @@ import signal
 def makebytes(data):
     if data is None:
         return b""
-    if isinstance(data, bytes):
+    if isinstance(data, (bytes, bytearray)):
         return data
+    elif isinstance(data, FileRange):
+        return data.read()
     else:
         return data.encode("UTF-8")
 
 
+# Can FileRange objects be used on this system.
+filerangeok = hasattr(os, "sendfile") and hasattr(os, "pread")
+
+
+class FileRange(object):
+    """Data item which is a byte range inside a file. senditem() sends it
+    with os.sendfile(), without copying it through Python buffers. The
+    object holds its own duplicate of the file descriptor, so the original
+    file can be closed before the answer is sent"""
+
+    def __init__(self, fd, offset, size):
+        self.fd = os.dup(fd)
+        self.offset = offset
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def read(self):
+        return os.pread(self.fd, self.size, self.offset)
+
+    def sendto(self, outfile):
+        """Write the data to a binary file object, which is flushed first"""
+        outfile.flush()
+        offset = self.offset
+        end = self.offset + self.size
+        try:
+            while offset < end:
+                sent = os.sendfile(outfile.fileno(), self.fd, offset, end - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError:
+            # Not all systems can sendfile() to a pipe (macOS only sends to
+            # sockets). Copy the rest.
+            pass
+        while offset < end:
+            data = os.pread(self.fd, min(end - offset, 1024 * 1024), offset)
+            if not data:
+                raise EOFError("FileRange: file is shorter than expected")
+            outfile.write(data)
+            offset += len(data)
+        self.close()
+
+
 ############################################
 # CmdTalk implements the communication protocol with the master
 # process. It calls an external method to use the args and produce
@@ -150,6 +205,11 @@ class CmdTalk(object):
         return (paramname, paramdata)
 
     def senditem(self, nm, data):
+        if isinstance(data, FileRange):
+            self.outfile.buffer.write(makebytes("%s: %d\n" % (nm, len(data))))
+            self.outfile.flush()
+            data.sendto(self.outfile.buffer)
+            return
         data = makebytes(data)
         l = len(data)
         self.outfile.buffer.write(makebytes("%s: %d\n" % (nm, l)))
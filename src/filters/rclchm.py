@@ -5,6 +5,7 @@ import sys
 import os
 import re
 import posixpath
+from collections import deque
 from urllib.parse import unquote as urllib_unquote
 from urllib.parse import urlparse as urlparse_urlparse
 from html.parser import HTMLParser
@@ -29,34 +30,48 @@ except:
         sys.exit(1)
 
 
+# Charset declaration fix and detection, and header/body extraction
+_asciito1252re = re.compile(
+    rb'(<meta *http-equiv *= *"content-type".*charset *= *)((us-)?ascii)( *" *>)',
+    re.IGNORECASE,
+)
+_findcharsetre = re.compile(
+    rb'<meta *http-equiv *= *"content-type".*charset *= *([a-z0-9-]+) *" *>',
+    re.IGNORECASE,
+)
+# How much of a document we look at for a charset decl
+_charsetpeeklen = 4096
+_headtagre = re.compile(rb"</head>", re.IGNORECASE)
+_headerre = re.compile(rb"(<head.*</head>)", re.IGNORECASE | re.DOTALL)
+_bodyre = re.compile(rb"<body[^>]*>(.*)</body>", re.IGNORECASE | re.DOTALL)
+_titlere = re.compile(rb"<title.*?</title>", re.IGNORECASE | re.DOTALL)
+
+
 def _deb(s):
     print("%s" % s, file=sys.stderr)
 
 
 # Small helper routines
-def getfile(chmfile, path):
+def getfile(rclchm, path):
     """Extract internal file text from chm object, given path"""
     if type(path) != type(b""):
         raise Exception("Chm:getfile: must be called with path as bytes")
-    res, ui = chmfile.ResolveObject(path)
-    if res != chmlib.CHM_RESOLVE_SUCCESS:
+    ui = rclchm.resolve(path)
+    if ui is None:
         # _deb("ResolveObject failed: %s" % path)
         return ""
-    res, doc = chmfile.RetrieveObject(ui)
+    res, doc = rclchm.chm.RetrieveObject(ui)
     if not res:
         _deb("RetrieveObject failed: %s" % path)
         return ""
     return doc
 
 
-def peekfile(chmfile, path, charset):
+def peekfile(rclchm, path, charset):
     """Check that path resolves in chm object"""
     if type(path) == type(""):
         path = path.encode(charset)
-    res, ui = chmfile.ResolveObject(path)
-    if res != chmlib.CHM_RESOLVE_SUCCESS:
-        return False
-    return True
+    return rclchm.resolve(path) is not None
 
 
 # CHM Topics tree handler
@@ -96,13 +111,9 @@ class ChmTopicsParser(HTMLParser):
         if tag != "param":
             return
 
-        name = ""
-        value = ""
-        for nm, val in attrs:
-            if nm == "name":
-                name = val
-            if nm == "value":
-                value = val
+        d = dict(attrs)
+        name = d.get("name", "")
+        value = d.get("value", "")
 
         # self.em.rclog("Name [%s] value [%s]" %(name, value))
 
@@ -122,7 +133,7 @@ class ChmTopicsParser(HTMLParser):
             # not work if the file is renamed. Just check that the internal
             # path resolves. Old: if ll[-3] == self.rclchm.sfn:
             localpath = ll[-1]
-            if not peekfile(self.rclchm.chm, localpath, self.rclchm.charset):
+            if not peekfile(self.rclchm, localpath, self.rclchm.charset):
                 # self.em.rclog("SKIPPING %s" % ll[-3])
                 localpath = ""
 
@@ -134,29 +145,55 @@ class ChmTopicsParser(HTMLParser):
 
 # Used when there is no Topics node. Walk the links tree
 class ChmWalker(HTMLParser):
-    """Links tree walker. This recursively follows all internal links
-    found in the tree from the top node given as input, and augments
-    the contents list."""
+    """Links tree walker. This follows all internal links found in the
+    tree from the top node given as input, and augments the contents
+    list. The same parser is reused for all pages: links to new pages
+    are queued and the pages are parsed in turn, we don't recurse."""
 
-    def __init__(self, rclchm, path, contents):
+    def __init__(self, rclchm, contents):
         HTMLParser.__init__(self)
         self.rclchm = rclchm
         self.chm = rclchm.chm
         self.contents = contents
+        # All the paths ever queued, for fast membership tests
+        self.seen = set()
+        self.queue = deque()
+        # Link path -> normalized path
+        self.normcache = {}
+        self.dir = b""
+
+    def walk(self, path, text):
+        """Walk the tree from the top node path, with already decoded text"""
         if type(path) == type(""):
             path = path.encode(self.rclchm.charset)
-        self.path = posixpath.normpath(path)
-        self.dir = posixpath.dirname(self.path)
-        contents.append(self.path)
+        path = posixpath.normpath(path)
+        self.seen.add(path)
+        self._parsepage(path, text)
+        while self.queue:
+            path = self.queue.popleft()
+            text = getfile(self.rclchm, path)
+            if text:
+                try:
+                    text, c = self.rclchm.fixencoding(text)
+                except:
+                    continue
+                self._parsepage(path, text)
+
+    def _parsepage(self, path, text):
+        self.contents.append(path)
+        self.dir = posixpath.dirname(path)
+        try:
+            self.reset()
+            self.feed(text)
+            self.close()
+        except:
+            pass
 
     def handle_starttag(self, tag, attrs):
         if tag != "a":
             return
 
-        href = ""
-        for nm, val in attrs:
-            if nm == "href":
-                href = val
+        href = dict(attrs).get("href", "")
 
         path = ""
         res = urlparse_urlparse(href)
@@ -168,7 +205,7 @@ class ChmWalker(HTMLParser):
                 # know this never happens because there was a runtime error
                 # in this path
                 path = lpath[2]
-                if not peekfile(self.chm, path, self.rclchm.charset):
+                if not peekfile(self.rclchm, path, self.rclchm.charset):
                     path = ""
             elif len(lpath) == 1:
                 path = lpath[0]
@@ -177,20 +214,17 @@ class ChmWalker(HTMLParser):
 
         if path:
             bpath = path.encode(self.rclchm.charset)
-            if path[0] == "/"[0]:
+            if path[0] != "/"[0]:
+                bpath = posixpath.join(self.dir, bpath)
+            # The same links are typically found in many pages
+            npath = self.normcache.get(bpath)
+            if npath is None:
                 npath = posixpath.normpath(bpath)
-            else:
-                npath = posixpath.normpath(posixpath.join(self.dir, bpath))
-            if not npath in self.contents:
-                # _deb("Going into [%s] paths [%s]\n" % (npath,str(self.contents)))
-                text = getfile(self.chm, npath)
-                if text:
-                    try:
-                        newwalker = ChmWalker(self.rclchm, npath, self.contents)
-                        t, c = self.rclchm.fixencoding(text)
-                        newwalker.feed(t)
-                    except:
-                        pass
+                self.normcache[bpath] = npath
+            if npath not in self.seen:
+                # _deb("Queueing [%s]" % npath)
+                self.seen.add(npath)
+                self.queue.append(npath)
 
 
 class rclCHM:
@@ -201,18 +235,13 @@ class rclCHM:
     def __init__(self, em):
         self.contents = []
         self.chm = chm.CHMFile()
+        # Internal path -> unit info, for the currently open file
+        self._uicache = {}
         self.em = em
         cf = rclconfig.RclConfig()
         self.catenate = cf.getConfParam("chmcatenate")
         self.catenate = int(self.catenate) if self.catenate else False
         self.em.setmimetype("text/html")
-        expr = rb'(<meta *http-equiv *= *"content-type".*charset *= *)((us-)?ascii)( *" *>)'
-        self.asciito1252re = re.compile(expr, re.IGNORECASE)
-        expr = rb'<meta *http-equiv *= *"content-type".*charset *= *([a-z0-9-]+) *" *>'
-        self.findcharsetre = re.compile(expr, re.IGNORECASE)
-        self._headtagre = re.compile(rb"</head>", re.IGNORECASE)
-        self._headerre = re.compile(rb"(<head.*</head>)", re.IGNORECASE | re.DOTALL)
-        self._bodyre = re.compile(rb"<body[^>]*>(.*)</body>", re.IGNORECASE | re.DOTALL)
 
     def extractone(self, path, norclaptag=False):
         """Extract one path-named internal file from the chm file"""
@@ -224,23 +253,22 @@ class rclCHM:
         if self.currentindex >= len(self.contents) - 1:
             iseof = rclexecm.RclExecM.eofnext
 
-        res, ui = self.chm.ResolveObject(path)
-        # self.em.rclog("extract: ResolveO: %d [%s]" % (res, ui))
-        if res != chmlib.CHM_RESOLVE_SUCCESS:
+        ui = self.resolve(path)
+        # self.em.rclog("extract: resolve: [%s]" % ui)
+        if ui is None:
             return (False, "", path, iseof)
         # RetrieveObject() returns len,value
         res, doc = self.chm.RetrieveObject(ui)
         # self.em.rclog("extract: RetrieveObject: %d [%s]" % (res, doc))
         if res > 0:
             if not norclaptag:
-                doc = self._headtagre.sub(
-                    b'<meta name="rclaptg" content="chm"></head>', doc
-                )
+                doc = _headtagre.sub(b'<meta name="rclaptg" content="chm"></head>', doc)
             return (True, doc, path, iseof)
         return (False, "", path, iseof)
 
     def dumpall(self):
-        alltxt = b""
+        # Extended in place, the result is sent as a single document.
+        alltxt = bytearray()
         first = True
         for pth in self.contents:
             ret, doc, path, iseof = self.extractone(pth, norclaptag=True)
@@ -248,7 +276,7 @@ class rclCHM:
                 continue
             if first:
                 # Save a header
-                headmatch = self._headerre.search(doc)
+                headmatch = _headerre.search(doc)
                 if headmatch:
                     header = headmatch[1]
                     # _deb("HEADER [%s]" % header)
@@ -257,20 +285,18 @@ class rclCHM:
                         title = self.chm.title.encode(self.charset)
                     else:
                         title = self.chm.title
-                    header = re.sub(
-                        rb"<title.*</title>",
-                        b"<title>" + title + b"</title>",
-                        doc,
-                        re.IGNORECASE | re.DOTALL,
+                    header = _titlere.sub(
+                        b"<title>" + title + b"</title>", header, count=1
                     )
                     first = False
-                    alltxt += header + b"<body>"
-            body = self._bodyre.search(doc)
+                    alltxt.extend(header)
+                    alltxt.extend(b"<body>")
+            body = _bodyre.search(doc)
             if body:
                 body = body[1]
                 # _deb("BODY [%s]" % body[0:200])
-                alltxt += body
-        alltxt += b"</body></html>"
+                alltxt.extend(body)
+        alltxt.extend(b"</body></html>")
         return alltxt
 
     def fixencoding(self, text):
@@ -286,18 +312,36 @@ class rclCHM:
         # <META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=US-ASCII">
 
         if type(text) == type(b""):
-            # Fix an ascii charset decl to windows-1252
-            text = self.asciito1252re.sub(rb"\1windows-1252\4", text, 1)
-            # Convert to unicode according to charset decl
-            m = self.findcharsetre.search(text)
-            if m:
-                charset = m.group(1).decode("cp1252")
-            else:
-                charset = "cp1252"
+            charset = "cp1252"
+            # The charset decl is in the <head>: no need to run the regexps
+            # over the whole document if the start has no http-equiv or no
+            # charset at all.
+            head = text[:_charsetpeeklen].lower()
+            if b"http-equiv" in head and b"charset" in head:
+                # Fix an ascii charset decl to windows-1252
+                text = _asciito1252re.sub(rb"\1windows-1252\4", text, 1)
+                # Convert to unicode according to charset decl
+                m = _findcharsetre.search(text)
+                if m:
+                    charset = m.group(1).decode("cp1252")
             text = text.decode(charset, errors="replace")
         return text, charset
 
+    def resolve(self, path):
+        """Resolve internal path to the chm unit info, or None if not found.
+        The results are cached as long as the file is open"""
+        try:
+            return self._uicache[path]
+        except KeyError:
+            pass
+        res, ui = self.chm.ResolveObject(path)
+        if res != chmlib.CHM_RESOLVE_SUCCESS:
+            ui = None
+        self._uicache[path] = ui
+        return ui
+
     def closefile(self):
+        self._uicache = {}
         self.chm.CloseCHM()
 
     def openfile(self, params):
@@ -306,6 +350,7 @@ class rclCHM:
 
         self.currentindex = -1
         self.contents = []
+        self._uicache = {}
 
         filename = params["filename"]
         if not self.chm.LoadCHM(filename):
@@ -324,6 +369,8 @@ class rclCHM:
             text, self.charset = self.fixencoding(self.topics)
             tp.feed(text)
             tp.close()
+            # Eliminate duplicates but keep order (dicts are ordered)
+            self.contents = list(dict.fromkeys(self.contents))
         else:
             # No topics. If there is a home, let's try to walk the tree
             # self.em.rclog("GetTopicsTree failed")
@@ -333,23 +380,14 @@ class rclCHM:
             home = self.chm.home
             if home[0] != b"/"[0]:
                 home = b"/" + home
-            text = getfile(self.chm, home)
+            text = getfile(self, home)
             if not text:
                 self.em.rclog("No topics and no home content")
                 return False
-            walker = ChmWalker(self, self.chm.home, self.contents)
             text, self.charset = self.fixencoding(text)
-            walker.feed(text)
-            walker.close()
-
-        # Eliminate duplicates but keep order (can't directly use set)
-        u = set()
-        ct = []
-        for t in self.contents:
-            if t not in u:
-                ct.append(t)
-                u.add(t)
-        self.contents = ct
+            walker = ChmWalker(self, self.contents)
+            walker.walk(self.chm.home, text)
+
         # self.em.rclog("Contents size %d contents %s" % (len(self.contents), self.contents))
         return True
 
@@ -390,6 +428,7 @@ class rclCHM:
             return ret
 
 
-proto = rclexecm.RclExecM()
-extract = rclCHM(proto)
-rclexecm.main(proto, extract)
+if __name__ == "__main__":
+    proto = rclexecm.RclExecM()
+    extract = rclCHM(proto)
+    rclexecm.main(proto, extract)
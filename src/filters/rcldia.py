@@ -18,24 +18,13 @@
 # Small fixes from jfd: dia files are sometimes not compressed.
 import rclexecm
 from rclbasehandler import RclBaseHandler
-import re
 from gzip import GzipFile
 import xml.parsers.expat
 
-# some regexps to parse/format the xml data: delete #/spaces at the b/eol and
-# ignore empty lines
-rhs = re.compile(r"^#\s*(.*)")
-rhe = re.compile(r"(.*)\s*#$")
-rempty = re.compile(r"^#?\s*#?$")
-
 
 # xml parser for dia xml file
 class Parser:
     def __init__(self, rclem):
-        self._parser = xml.parsers.expat.ParserCreate(encoding="UTF-8")
-        self._parser.StartElementHandler = self.startelement
-        self._parser.EndElementHandler = self.endelement
-        self._parser.CharacterDataHandler = self.chardata
         self.string = []
         self.handlethis = False
         self.rclem = rclem
@@ -48,22 +37,35 @@ class Parser:
 
     def chardata(self, data):
         if self.handlethis:
-            # check if line is not empty and replace hashes/spaces
-            if not rempty.search(data):
-                self.string.append(rhe.sub(r"\1", rhs.sub(r"\1", data)))
+            # delete #/spaces at the b/eol and ignore empty lines
+            s = data.strip()
+            if s.startswith("#"):
+                s = s[1:].lstrip()
+            if s.endswith("#"):
+                s = s[:-1].rstrip()
+            if s:
+                self.string.append(s)
 
     def endelement(self, name):
         self.handlethis = False
 
     def feed(self, fh):
-        self._parser.ParseFile(fh)
-        del self._parser
+        # An expat parser can't be reused after parsing a complete
+        # document, but we keep the rest of the object for the next file.
+        self.string = []
+        self.handlethis = False
+        parser = xml.parsers.expat.ParserCreate(encoding="UTF-8")
+        parser.StartElementHandler = self.startelement
+        parser.EndElementHandler = self.endelement
+        parser.CharacterDataHandler = self.chardata
+        parser.ParseFile(fh)
 
 
 class DiaExtractor(RclBaseHandler):
 
     def __init__(self, em):
         super(DiaExtractor, self).__init__(em)
+        self.diap = Parser(em)
 
     def html_text(self, fn):
         try:
@@ -76,17 +78,17 @@ class DiaExtractor(RclBaseHandler):
             # File not compressed ?
             dia = open(fn, "rb")
 
-        diap = Parser(self.em)
-        diap.feed(dia)
+        self.diap.feed(dia)
 
         html = "<html><head><title></title></head><body><pre>"
-        html += rclexecm.htmlescape("\n".join(diap.string))
+        html += rclexecm.htmlescape("\n".join(self.diap.string))
         html += "</pre></body></html>"
 
         return html
 
 
 # Main program: create protocol handler and extractor and run them
-proto = rclexecm.RclExecM()
-extract = DiaExtractor(proto)
-rclexecm.main(proto, extract)
+if __name__ == "__main__":
+    proto = rclexecm.RclExecM()
+    extract = DiaExtractor(proto)
+    rclexecm.main(proto, extract)
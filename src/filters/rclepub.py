@@ -18,6 +18,12 @@ except:
     print("RECFILTERROR HELPERNOTFOUND python3:epub")
     sys.exit(1)
 
+# Used for stripping the xml/html/body wrappers when catenating the chapters
+_xmldeclre = re.compile(rb"<\?.*\?>")
+_htmlbodyre = re.compile(rb"<html.*<body[^>]*>", re.DOTALL | re.I)
+_endbodyre = re.compile(rb"</body>", re.I)
+_endhtmlre = re.compile(rb"</html>", re.I)
+
 
 class rclEPUB:
     """RclExecM slave worker for extracting all text from an EPUB
@@ -34,12 +40,8 @@ class rclEPUB:
 
     def _docheader(self):
         meta = self.book.opf.metadata
-        title = ""
-        for tt, lang in meta.titles:
-            title += tt + " "
-        author = ""
-        for name, role, fileas in meta.creators:
-            author += name + " "
+        title = " ".join(tt for tt, lang in meta.titles)
+        author = " ".join(name for name, role, fileas in meta.creators)
         data = "<html>\n<head>\n"
         if title:
             data += "<title>" + rclexecm.htmlescape(title) + "</title>\n"
@@ -55,38 +57,33 @@ class rclEPUB:
                 + rclexecm.htmlescape(meta.description)
                 + '">\n'
             )
-        for value in meta.subjects:
-            data += (
-                '<meta name="dc:subject" content="'
-                + rclexecm.htmlescape(value)
-                + '">\n'
-            )
+        data += "".join(
+            '<meta name="dc:subject" content="' + rclexecm.htmlescape(value) + '">\n'
+            for value in meta.subjects
+        )
         data += "</head>"
         return data.encode("UTF-8")
 
-    def _catbodies(self):
-        data = b"<body>"
-        ids = []
+    def _catbodies(self, data):
+        data.extend(b"<body>")
+        # The manifest is an ordered id->item dict
+        manifest = self.book.opf.manifest
         if self.book.opf.spine:
-            for id, linear in self.book.opf.spine.itemrefs:
-                ids.append(id)
+            items = [manifest.get(id) for id, linear in self.book.opf.spine.itemrefs]
         else:
-            for id, item in self.book.opf.manifest.items():
-                ids.append(id)
+            items = manifest.values()
 
-        for id in ids:
-            item = self.book.get_item(id)
+        for item in items:
             if item is None or item.media_type != "application/xhtml+xml":
                 continue
             doc = self.book.read_item(item)
-            doc = re.sub(rb"<\?.*\?>", b"", doc)
-            doc = re.sub(rb"<html.*<body[^>]*>", b"", doc, 1, flags=re.DOTALL | re.I)
-            doc = re.sub(rb"</body>", b"", doc, flags=re.I)
-            doc = re.sub(rb"</html>", b"", doc, flags=re.I)
-            data += doc
+            doc = _xmldeclre.sub(b"", doc)
+            doc = _htmlbodyre.sub(b"", doc, 1)
+            doc = _endbodyre.sub(b"", doc)
+            doc = _endhtmlre.sub(b"", doc)
+            data.extend(doc)
 
-        data += b"</body></html>"
-        return data
+        data.extend(b"</body></html>")
 
     def _selfdoc(self):
         data = self._docheader()
@@ -123,8 +120,11 @@ class rclEPUB:
             return (False, "", id, iseof)
 
     def dumpall(self):
-        data = self._docheader()
-        data += self._catbodies()
+        # The protocol needs the full document size before sending, so we
+        # can't stream the chapters. Accumulate them in a mutable buffer to
+        # avoid copying the whole data again at the end.
+        data = bytearray(self._docheader())
+        self._catbodies(data)
         return data
 
     def closefile(self):
@@ -174,6 +174,7 @@ class rclEPUB:
             return ret
 
 
-proto = rclexecm.RclExecM()
-extract = rclEPUB(proto)
-rclexecm.main(proto, extract)
+if __name__ == "__main__":
+    proto = rclexecm.RclExecM()
+    extract = rclEPUB(proto)
+    rclexecm.main(proto, extract)
@@ -53,6 +53,8 @@ def logmsg(msg):
 def makebytes(data):
     if type(data) == type(""):
         return data.encode("UTF-8")
+    if isinstance(data, cmdtalk.FileRange):
+        return data.read()
     return data
 
 
@@ -233,6 +235,9 @@ class RclExecM(cmdtalk.CmdTalk):
     def setmimetype(self, mt):
         self.mimetype = makebytes(mt)
 
+    # The fields are only stored here, and sent along with the next answer(),
+    # in the same message and the same flush. Setting several fields costs no
+    # additional I/O.
     def setfield(self, nm, value):
         self.fields[nm] = value
 
@@ -11,6 +11,8 @@
 
 import rclexecm
 import sys
+import re
+import mmap
 
 # Decide how we'll process the file.
 modules = ("internal", "icalendar", "vobject")
@@ -133,47 +135,58 @@ class ICalSimpleSplitter:
     # Note that if an 'interesting' element is nested inside another one,
     # it will not be extracted (stay as text in external event). This is
     # not an issue and I don't think it can happen with the current list
-    interesting = (b"VTODO", b"VEVENT", b"VJOURNAL")
+    interesting = frozenset((b"VTODO", b"VEVENT", b"VJOURNAL"))
+
+    # We only look at the BEGIN/END lines for the interesting objects, all
+    # the rest is just sliced out of the file data. The names are case
+    # insensitive. Trying a case-sensitive scan first is not worth it: it
+    # is not measurably faster, and a fallback decision could not detect
+    # files which mix upper and lower case.
+    blockre = re.compile(
+        rb"^(BEGIN|END):(" + b"|".join(sorted(interesting)) + rb")[ \t\r]*$",
+        re.MULTILINE | re.IGNORECASE,
+    )
 
     def splitcalendar(self, fin):
+        # Map the file if possible, to avoid a copy of the whole data. Only
+        # the block slices are copied.
+        try:
+            data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty file or not mappable
+            return self.splitdata(fin.read())
+        with data:
+            return self.splitdata(data)
+
+    def splitdata(self, data):
         curblkname = b""
-        curblk = b""
+        curblkstart = 0
 
         lo = []
-        for line in fin:
-            line = line.rstrip()
-            if line == b"":
-                continue
-
-            if curblkname:
-                curblk = curblk + line + b"\n"
-
-            l = line.split(b":")
-            if len(l) < 2:
-                continue
-
+        for m in ICalSimpleSplitter.blockre.finditer(data):
+            what = m.group(1).upper()
+            name = m.group(2).upper()
             # If not currently inside a block and we see an
             # 'interesting' BEGIN, start block
-            if curblkname == b"" and l[0].upper() == b"BEGIN":
-                name = l[1].upper()
-                if name in ICalSimpleSplitter.interesting:
+            if curblkname == b"":
+                if what == b"BEGIN":
                     curblkname = name
-                    curblk = curblk + line + b"\n"
-
+                    curblkstart = m.start()
             # If currently accumulating block lines, check for end
-            if curblkname and l[0].upper() == b"END" and l[1].upper() == curblkname:
-                lo.append(curblk)
+            elif what == b"END" and name == curblkname:
+                lo.append(self._mkblock(data[curblkstart : m.end()]))
                 curblkname = b""
-                curblk = b""
 
-        if curblk:
-            lo.append(curblk)
-            curblkname = b""
-            curblk = b""
+        if curblkname:
+            lo.append(self._mkblock(data[curblkstart:]))
 
         return lo
 
+    def _mkblock(self, blk):
+        return blk.replace(b"\r\n", b"\n").rstrip() + b"\n"
+
 
-proto = rclexecm.RclExecM()
-extract = IcalExtractor(proto)
-rclexecm.main(proto, extract)
+if __name__ == "__main__":
+    proto = rclexecm.RclExecM()
+    extract = IcalExtractor(proto)
+    rclexecm.main(proto, extract)
@@ -6,6 +6,8 @@
 import rclexecm
 import sys
 import os
+import io
+import re
 import subprocess
 
 # Prototype for the html document we're returning. Info files are
@@ -15,6 +17,18 @@ import subprocess
 # Some info source docs contain charset info like:
 # @documentencoding ISO-2022-JP
 # But this seems to be absent from outputs.
+#
+# Strange whitespace to avoid changing the module tests (same as old).
+# The node name goes between head and body, the escaped text between body
+# and tail.
+_htmlhead = b"\n<html>\n  <head>\n      <title>"
+_htmlbody = (
+    b"</title>\n"
+    b'      <meta name="rclaptg" content="gnuinfo">\n'
+    b"   </head>\n   <body>\n"
+    b'   <pre style="white-space: pre-wrap">\n   '
+)
+_htmltail = b"\n   </pre></body>\n</html>\n"
 
 
 # RclExecm interface
@@ -31,17 +45,7 @@ class InfoExtractor:
         nodename, docdata = self.contents[index]
         nodename = rclexecm.htmlescape(nodename)
         docdata = rclexecm.htmlescape(docdata)
-        # strange whitespace to avoid changing the module tests (same as old)
-        docdata = (
-            b"\n<html>\n  <head>\n      <title>"
-            + nodename
-            + b"</title>\n"
-            + b'      <meta name="rclaptg" content="gnuinfo">\n'
-            + b"   </head>\n   <body>\n"
-            + b'   <pre style="white-space: pre-wrap">\n   '
-            + docdata
-            + b"\n   </pre></body>\n</html>\n"
-        )
+        docdata = b"".join((_htmlhead, nodename, _htmlbody, docdata, _htmltail))
 
         iseof = rclexecm.RclExecM.noteof
         if self.currentindex >= len(self.contents) - 1:
@@ -57,21 +61,25 @@ class InfoExtractor:
             self.em.rclog("Openfile: %s is not a file" % self.file)
             return False
 
-        cmd = b"info --subnodes -o - -f " + self.file
-        nullstream = open(os.devnull, "w")
+        cmd = ["info", "--subnodes", "-o", "-", "-f", self.file]
         try:
-            infostream = subprocess.Popen(
-                cmd, shell=True, bufsize=1, stderr=nullstream, stdout=subprocess.PIPE
-            ).stdout
-        except Exception as e:
+            proc = subprocess.Popen(
+                cmd, stderr=subprocess.DEVNULL, stdout=subprocess.PIPE
+            )
+        except FileNotFoundError:
             # Consider this as permanently fatal.
-            self.em.rclog("Openfile: exec info: %s" % str(e))
+            self.em.rclog("Openfile: info command not found")
             print("RECFILTERROR HELPERNOTFOUND info")
             sys.exit(1)
+        except Exception as e:
+            self.em.rclog("Openfile: exec info: %s" % str(e))
+            return False
+        # We need the whole output anyway: read it in one go.
+        out, err = proc.communicate()
 
         self.currentindex = -1
 
-        self.contents = InfoSimpleSplitter().splitinfo(self.file, infostream)
+        self.contents = InfoSimpleSplitter().splitinfo(self.file, io.BytesIO(out))
 
         # self.em.rclog("openfile: Entry count: %d"%(len(self.contents)))
         return True
@@ -106,6 +114,13 @@ class InfoExtractor:
             return ret
 
 
+# Node header line. It sometimes begins with spaces, see below
+_headerre = re.compile(rb" *File: ")
+# The header fields we use, extracted in one pass.
+# e.g.: File: recoll.info,  Node: Top,  Next: Intro,  Up: (dir)
+_headerfieldre = re.compile(rb"(?:^|,)\s*(File|Node|Up)\s*:\s*([^,\n\r]*)")
+
+
 # Info file splitter
 class InfoSimpleSplitter:
 
@@ -114,7 +129,8 @@ class InfoSimpleSplitter:
         index = 0
         listout = []
         node_dict = {}
-        node = b""
+        # Lines for the current node
+        node = []
         infofile = os.path.basename(filename)
         nodename = b"Unknown"
 
@@ -125,31 +141,25 @@ class InfoSimpleSplitter:
             # beginning with spaces (it's a bug probably, only seen it once)
             # Maybe we'd actually be better off directly interpreting the
             # info files
-            if gotblankline and line.lstrip(b" ").startswith(b"File: "):
-                prevnodename = nodename
-                line = line.rstrip(b"\n\r")
-                pairs = line.split(b",")
-                up = b"Top"
-                nodename = str(index)
-                try:
-                    for pair in pairs:
-                        name, value = pair.split(b":")
-                        name = name.strip(b" ")
-                        value = value.strip(b" ")
-                        if name == b"Node":
-                            nodename = value
-                        if name == b"Up":
-                            up = value
-                        if name == b"File":
-                            infofile = value
-                except Exception as err:
+            stripped = line.rstrip(b"\n\r")
+            if gotblankline and _headerre.match(line):
+                fields = {}
+                for m in _headerfieldre.finditer(stripped):
+                    fields[m.group(1)] = m.group(2).strip(b" ")
+                # A body line may also begin with "File:". Only a line with
+                # a Node field is a node header.
+                if b"Node" not in fields:
                     print(
-                        "rclinfo.py: bad line in %s: [%s] %s\n" % (infofile, line, err),
+                        "rclinfo.py: bad line in %s: [%s]\n" % (infofile, stripped),
                         file=sys.stderr,
                     )
-                    nodename = prevnodename
-                    node += line
+                    node.append(line)
                     continue
+                prevnodename = nodename
+                line = stripped
+                nodename = fields[b"Node"]
+                up = fields.get(b"Up", b"Top")
+                infofile = fields.get(b"File", infofile)
 
                 if nodename in node_dict:
                     print(
@@ -159,37 +169,41 @@ class InfoSimpleSplitter:
                 node_dict[nodename] = up
 
                 if index != 0:
-                    listout.append((prevnodename, node))
-                node = b""
+                    listout.append((prevnodename, b"".join(node)))
+                node = []
                 index += 1
 
-            if line.rstrip(b"\n\r") == b"":
+            if stripped == b"":
                 gotblankline = 1
             else:
                 gotblankline = 0
 
-            node += line
+            node.append(line)
 
         # File done, add last dangling node
-        if node != b"":
-            listout.append((nodename, node))
+        if node:
+            listout.append((nodename, b"".join(node)))
 
         # Compute node paths (concatenate "Up" values), to be used
         # as page titles. It's unfortunate that this will crash if
-        # the info file tree is bad
+        # the info file tree is bad.
+        # Nodes share their ancestors, so the paths are memoized by node
+        # name. None is stored for nodes with a broken tree.
+        paths = {b"Top": b""}
         listout1 = []
         for nodename, node in listout:
-            title = b""
+            # Nodes with yet unknown paths, bottom-up
+            chain = []
             loop = 0
             error = 0
-            while nodename != b"Top":
-                title = nodename + b" / " + title
+            while nodename not in paths:
+                chain.append(nodename)
                 if nodename in node_dict:
                     nodename = node_dict[nodename]
                 else:
                     print(
                         "Infofile: node's Up does not exist: file %s, path %s, up [%s]"
-                        % (infofile, title, nodename),
+                        % (infofile, b" / ".join(reversed(chain)), nodename),
                         sys.stderr,
                     )
                     error = 1
@@ -200,13 +214,15 @@ class InfoSimpleSplitter:
                     error = 1
                     break
 
-            if error:
+            path = None if error else paths[nodename]
+            for nm in reversed(chain):
+                if path is not None:
+                    path = path + b" / " + nm if path else nm
+                paths[nm] = path
+            if path is None:
                 continue
 
-            if title == b"":
-                title = infofile
-            else:
-                title = infofile + b" / " + title
+            title = infofile + b" / " + path if path else infofile
             title = title.rstrip(b" / ")
             listout1.append((title, node))
 
@@ -10,42 +10,61 @@ import re
 import codecs
 from rclbasehandler import RclBaseHandler
 
-try:
-    import rcllatinclass
-except:
-    pass
-
 try:
     import rclmidi as midi
 except:
     print("RECFILTERROR HELPERNOTFOUND python3:midi")
     sys.exit(1)
 
-try:
-    import chardet
+# chardet is only needed when the file name does not give the encoding
+# and the lyrics are not plain ASCII. It is slow to import, so this is
+# done on first use.
+chardet = None
+has_chardet = None
 
-    has_chardet = True
-except:
-    has_chardet = False
 
-# Prototype for the html document we're returning
-htmltemplate = """
+def _loadchardet():
+    global chardet, has_chardet
+    if has_chardet is None:
+        try:
+            import chardet
+
+            has_chardet = True
+        except:
+            has_chardet = False
+    return has_chardet
+
+
+# Prototype for the html document we're returning. Bytes: the fields are
+# utf-8 encoded by reencode()
+htmltemplate = b"""
 <html>
   <head>
     <meta http-equiv="content-type" content="text/html; charset=utf-8">
-    <title>%s</title>
-      <meta name="author" content="%s">
-      <meta name="language" content="%s">
+    <title>%b</title>
+      <meta name="author" content="%b">
+      <meta name="language" content="%b">
    </head>
    <body>
-   %s
+   %b
    </body>
 </html>
 """
 
+# Encoding given in the file name, as in 'some title (encoding).kar'
+_fnencodingre = re.compile(rb"\(([^\)]+)\)\.[a-zA-Z]+$")
+
 nlbytes = b"\n"
-bsbytes = b"\\"
 nullchar = 0
+# Byte values for the karaoke event markers
+slashchar = ord("/")
+bschar = ord("\\")
+lbrchar = ord("[")
+rbrchar = ord("]")
+atchar = ord("@")
+ichar = ord("I")
+lchar = ord("L")
+tchar = ord("T")
 
 
 class KarTextExtractor(RclBaseHandler):
@@ -98,6 +117,7 @@ class KarTextExtractor(RclBaseHandler):
         self.defaultencoding = ""
         self.hadnulls = False
         self.classifier = None
+        self.decoder = None
 
         # Compute the fallback encoding to use if we can't determine
         # one when processing the file. Based on the nls environment
@@ -133,24 +153,19 @@ class KarTextExtractor(RclBaseHandler):
 
     def reencode(self, data):
         """Decode from whatever encoding we think this file is using
-        and reencode as UTF-8"""
+        and reencode as html-escaped UTF-8"""
 
         # self.em.rclog("Reencoding from [%s] to UTF-8" % self.encoding)
 
-        if data:
-            try:
-                data = data.decode(self.encoding, "ignore")
-            except Exception as err:
-                self.em.rclog("Decode failed: " + str(err))
-                return ""
-            try:
-                data = data.encode("utf-8")
-            except Exception as err:
-                self.em.rclog("Encode failed: " + str(err))
-                return ""
-
-            data = rclexecm.htmlescape(data).decode("utf-8").replace("\n", "<br>\n")
-        return data
+        if not data:
+            return b""
+        try:
+            data = self.decoder(data, "ignore")[0]
+        except Exception as err:
+            self.em.rclog("Decode failed: " + str(err))
+            return b""
+        data = rclexecm.htmlescape(data).replace("\n", "<br>\n")
+        return data.encode("utf-8")
 
     def encodingfromfilename(self, fn):
         """Compute encoding from file name: some karaoke files have the
@@ -159,10 +174,10 @@ class KarTextExtractor(RclBaseHandler):
         just one our users could use if there is trouble with guessing
         encodings"""
 
-        rexp = rb"\(([^\)]+)\)\.[a-zA-Z]+$"
-        m = re.search(rexp, fn)
+        m = _fnencodingre.search(fn)
         if m:
-            return m.group(1)
+            # codecs.lookup() wants str
+            return m.group(1).decode("ascii", errors="replace")
         else:
             return ""
 
@@ -178,21 +193,28 @@ class KarTextExtractor(RclBaseHandler):
         # much more common). We use our own ad-hoc stopwords based
         # module to try and improve
         if encoding.lower() == "iso-8859-2":
+            # The classifier is built on first use. False means that this
+            # failed, don't retry for each file.
             if self.classifier is None:
+                self.classifier = False
                 try:
                     import __main__
+                    import rcllatinclass
 
                     dir = os.path.dirname(__main__.__file__)
                     langszip = os.path.join(dir, "rcllatinstops.zip")
                     f = open(langszip)
                     f.close()
-                    classifier = rcllatinclass.European8859TextClassifier(langszip)
+                    self.classifier = rcllatinclass.European8859TextClassifier(
+                        langszip
+                    )
                 except:
                     self.em.rclog("Can't build euroclassifier (missing stopwords zip?")
-                    return (encoding, confidence)
+            if not self.classifier:
+                return (encoding, confidence)
 
             try:
-                lang, code, count = classifier.classify(text)
+                lang, code, count = self.classifier.classify(text)
                 # self.em.rclog("euclass lang/code/matchcount: %s %s %d" % \
                 #              (lang, code, count))
                 if count > 0:
@@ -219,37 +241,38 @@ class KarTextExtractor(RclBaseHandler):
         title = None
         author = None
         language = None
-        lyrics = b""
-        lyricsN = b""
+        lyrics = bytearray()
+        lyricsN = bytearray()
         self.hadnulls = False
 
         for event in stream.iterevents():
             edata = b""
             if isinstance(event, midi.TextMetaEvent):
-                if not event.data:
+                data = event.data
+                if not data:
                     continue
-                elif event.data[0] == b"/"[0] or event.data[0] == bsbytes[0]:
-                    edata = nlbytes + event.data[1:]
-                elif event.data[0] == b"["[0] or event.data[0] == b"]"[0]:
-                    edata = event.data[1:]
-                elif event.data[0] == b"@"[0]:
-                    if len(event.data) == 1:
+                elif data[0] == slashchar or data[0] == bschar:
+                    edata = nlbytes + data[1:]
+                elif data[0] == lbrchar or data[0] == rbrchar:
+                    edata = data[1:]
+                elif data[0] == atchar:
+                    if len(data) == 1:
                         continue
                     else:
-                        if event.data[1] == b"I"[0]:
-                            edata = event.data[2:] + nlbytes
-                        elif event.data[1] == b"L"[0]:
-                            language = self.nulltrunc(event.data[2:])
-                            languageN = event.data[2:]
-                        elif event.data[1] == b"T"[0]:
+                        if data[1] == ichar:
+                            edata = data[2:] + nlbytes
+                        elif data[1] == lchar:
+                            language = self.nulltrunc(data[2:])
+                            languageN = data[2:]
+                        elif data[1] == tchar:
                             if title is None:
-                                title = self.nulltrunc(event.data[2:])
-                                titleN = event.data[2:]
+                                title = self.nulltrunc(data[2:])
+                                titleN = data[2:]
                             elif author is None:
-                                author = self.nulltrunc(event.data[2:])
-                                authorN = event.data[2:]
+                                author = self.nulltrunc(data[2:])
+                                authorN = data[2:]
                 else:
-                    edata = event.data
+                    edata = data
             elif isinstance(event, midi.LryricsEvent) or isinstance(
                 event, midi.TrackNameEvent
             ):
@@ -258,13 +281,17 @@ class KarTextExtractor(RclBaseHandler):
                     nl = nlbytes
                 if not event.data:
                     continue
-                elif event.data[0] == b"/"[0] or event.data[0] == bsbytes[0]:
+                elif event.data[0] == slashchar or event.data[0] == bschar:
                     edata = nlbytes + event.data[1:] + nl
                 else:
                     edata = event.data + nl
 
-            lyrics += self.nulltrunc(edata)
-            lyricsN += edata
+            lyrics.extend(self.nulltrunc(edata))
+            lyricsN.extend(edata)
+
+        # The stopwords classifier needs hashable words
+        lyrics = bytes(lyrics)
+        lyricsN = bytes(lyricsN)
 
         # Try to guess the encoding. First do it with the data
         # possibly containing nulls. If we get one of the accepted
@@ -273,9 +300,16 @@ class KarTextExtractor(RclBaseHandler):
 
         # self.em.rclog("Lyrics length %d" % len(lyrics))
 
-        if self.encoding == "" and has_chardet:
+        # Pure ASCII without nulls needs no guessing. With nulls, this
+        # may be utf-16/32, leave it to chardet.
+        if self.encoding == "" and not self.hadnulls and lyrics.isascii():
+            self.encoding = "utf-8"
+
+        if self.encoding == "" and _loadchardet():
+            detected = None
             if self.hadnulls:
-                (encoding, confidence) = self.chardet_detect(lyricsN)
+                detected = self.chardet_detect(lyricsN)
+                (encoding, confidence) = detected
                 # self.em.rclog("With nulls: chardet: enc [%s], conf %.2f" % \
                 #              (encoding, confidence))
                 if confidence > 0.6 and encoding.lower() in self.acceptnullencodings:
@@ -283,8 +317,15 @@ class KarTextExtractor(RclBaseHandler):
                     lyrics = lyricsN
                     title = titleN
                     author = authorN
+                elif lyrics != lyricsN:
+                    # The nulls were in the lyrics: guess again without
+                    # them. Else (nulls only in title etc.), chardet would
+                    # just return the same thing.
+                    detected = None
             if self.encoding == "":
-                (encoding, confidence) = self.chardet_detect(lyrics)
+                if detected is None:
+                    detected = self.chardet_detect(lyrics)
+                (encoding, confidence) = detected
                 # self.em.rclog("No nulls: chardet: enc [%s], conf %.2f" % \
                 #              (encoding, confidence))
                 if confidence > 0.6:
@@ -296,12 +337,22 @@ class KarTextExtractor(RclBaseHandler):
             )
             self.encoding = self.defaultencoding
 
+        try:
+            self.decoder = codecs.getdecoder(self.encoding)
+        except LookupError:
+            self.em.rclog(
+                "Unknown encoding [%s], defaulting to [%s]"
+                % (self.encoding, self.defaultencoding)
+            )
+            self.encoding = self.defaultencoding
+            self.decoder = codecs.getdecoder(self.encoding)
+
         if title is None:
-            title = ""
+            title = b""
         if author is None:
-            author = ""
+            author = b""
         if language is None:
-            language = ""
+            language = b""
 
         title = self.reencode(title)
         author = self.reencode(author)
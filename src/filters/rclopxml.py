@@ -165,13 +165,38 @@ content_stylesheet = """<?xml version="1.0"?>
 """
 
 
+# Slide and page member name prefixes. The names are prefix + number + .xml,
+# the number is used for sorting.
+_ppslides = "ppt/slides/slide"
+_ppnotes = "ppt/notesSlides/notesSlide"
+_vspages = "visio/pages/page"
+_numberedre = re.compile("(%s|%s|%s)([0-9]+)\\.xml$" % (_ppslides, _ppnotes, _vspages))
+
+
+def _numberedmembers(names):
+    """Sort out the numbered members in a single pass over the names.
+    Returns a dict prefix->names, each list in numeric order"""
+    members = {}
+    for m in map(_numberedre.match, names):
+        if m:
+            members.setdefault(m.group(1), []).append((int(m.group(2)), m.string))
+    return {prefix: [nm for num, nm in sorted(lst)] for prefix, lst in members.items()}
+
+
 class OXExtractor(RclBaseHandler):
     def __init__(self, em):
         super(OXExtractor, self).__init__(em)
         self.forpreview = os.environ.get("RECOLL_FILTER_FORPREVIEW", "no")
+        # Computed style sheets, by doc type name
+        self.stylesheets = {}
 
     # Replace values inside data style sheet, depending on type of doc
     def computestylesheet(self, nm):
+        if nm not in self.stylesheets:
+            self.stylesheets[nm] = self._computestylesheet(nm)
+        return self.stylesheets[nm]
+
+    def _computestylesheet(self, nm):
         decls = globals()[nm + "_xmlns_decls"]
         stylesheet = content_stylesheet.replace("@XMLNS_DECLS@", decls)
         tagmatch = globals()[nm + "_tagmatch"]
@@ -185,74 +210,61 @@ class OXExtractor(RclBaseHandler):
 
         f = open(fn, "rb")
         zip = ZipFile(f)
+        members = _numberedmembers(zip.namelist())
 
-        docdata = b"<html><head>"
+        parts = [b"<html><head>"]
 
         try:
             metadata = zip.read("docProps/core.xml")
             if metadata:
-                res = rclxslt.apply_sheet_data(meta_stylesheet, metadata)
-                docdata += res
+                parts.append(rclxslt.apply_sheet_data(meta_stylesheet, metadata))
         except Exception as err:
             pass
 
-        docdata += b"</head><body>"
+        parts.append(b"</head><body>")
 
         try:
             content = zip.read("word/document.xml")
             stl = self.computestylesheet("word")
-            docdata += rclxslt.apply_sheet_data(stl, content)
+            parts.append(rclxslt.apply_sheet_data(stl, content))
         except:
             pass
 
         try:
             content = zip.read("xl/sharedStrings.xml")
             stl = self.computestylesheet("xl")
-            docdata += rclxslt.apply_sheet_data(stl, content)
+            parts.append(rclxslt.apply_sheet_data(stl, content))
         except:
             pass
 
         try:
-            stl = None
-            # Extract number suffix for numeric sort
-            for prefix in ("ppt/slides/slide", "ppt/notesSlides/notesSlide"):
-                exp = prefix + "[0-9]+" + ".xml"
-                names = [fn for fn in zip.namelist() if re.match(exp, fn)]
-                for fn in sorted(
-                    names, key=lambda e, prefix=prefix: int(e[len(prefix) : len(e) - 4])
-                ):
-                    if stl is None:
-                        stl = self.computestylesheet("pp")
-                    content = zip.read(fn)
+            stl = self.computestylesheet("pp")
+            for prefix in (_ppslides, _ppnotes):
+                for fn in members.get(prefix, ()):
                     if self.forpreview == "yes":
-                        docdata += (
+                        parts.append(
                             b"<h2>" + fn.encode("utf-8", errors="ignore") + b"</h2>"
                         )
-                    docdata += rclxslt.apply_sheet_data(stl, content)
+                    # Let lxml parse from the zip stream, no need to
+                    # decompress the whole member in memory first.
+                    with zip.open(fn) as fp:
+                        parts.append(rclxslt.apply_sheet_file(stl, fp))
         except Exception as ex:
             # self.em.rclog("PPT Exception: %s" % ex)
             pass
 
         try:
-            stl = None
-            # Extract number suffix for numeric sort
-            prefix = "visio/pages/page"
-            exp = prefix + "[0-9]+" + ".xml"
-            names = [fn for fn in zip.namelist() if re.match(exp, fn)]
-            for fn in sorted(
-                names, key=lambda e, prefix=prefix: int(e[len(prefix) : len(e) - 4])
-            ):
-                if stl is None:
-                    stl = self.computestylesheet("vs")
-                content = zip.read(fn)
-                docdata += rclxslt.apply_sheet_data(stl, content)
+            stl = self.computestylesheet("vs")
+            for fn in members.get(_vspages, ()):
+                with zip.open(fn) as fp:
+                    parts.append(rclxslt.apply_sheet_file(stl, fp))
         except Exception as ex:
             # self.em.rclog("VISIO Exception: %s" % ex)
             pass
 
-        docdata += b"</body></html>"
+        parts.append(b"</body></html>")
 
-        return docdata
+        return b"".join(parts)
 
 
 if __name__ == "__main__":
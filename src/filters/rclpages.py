@@ -40,7 +40,10 @@ class PagesHandler(RclBaseHandler):
         infn = os.path.basename(inpath)
         inbase = os.path.splitext(infn)[0]
         htmlfile = os.path.join(self.tmpdir.getpath().encode('utf-8'), inbase) + b".html"
-        return open(htmlfile).read()
+        # Return the raw bytes: no decoding and reencoding, the charset
+        # is declared in the document
+        with open(htmlfile, "rb") as f:
+            return f.read()
 
 
 if __name__ == "__main__":
@@ -55,6 +55,17 @@ except Exception as ex:
         print("RECFILTERROR HELPERNOTFOUND python3:rarfile/python3:unrar")
         sys.exit(1)
 
+# Directory test for a member info object, chosen once for the module in use
+if using_unrar:
+    # dll.hpp RHDF_DIRECTORY: 0x20
+    def _isdir(rarinfo):
+        return (rarinfo.flag_bits & 0x20) != 0
+
+else:
+
+    def _isdir(rarinfo):
+        return rarinfo.isdir()
+
 
 # Requires RarFile python module. Try "sudo pip install rarfile" or
 # install it with the system package manager
@@ -67,6 +78,8 @@ except Exception as ex:
 # to rar, and changed this comment.
 class RarExtractor(ArchiveExtractor):
     def __init__(self, em):
+        self.namen = []
+        self.lastindex = -1
         super().__init__(em)
 
     def extractone(self, ipath):
@@ -75,15 +88,12 @@ class RarExtractor(ArchiveExtractor):
         isdir = False
 
         try:
-            if using_unrar:
-                if type(ipath) == type(b""):
-                    ipath = ipath.decode("UTF-8")
-                rarinfo = self.rar.getinfo(ipath)
-                # dll.hpp RHDF_DIRECTORY: 0x20
-                isdir = (rarinfo.flag_bits & 0x20) != 0
-            else:
-                rarinfo = self.rar.getinfo(ipath)
-                isdir = rarinfo.isdir()
+            # Only ipaths from getipath() are bytes: the names from
+            # namelist(), used by getnext(), are already str.
+            if using_unrar and isinstance(ipath, bytes):
+                ipath = ipath.decode("UTF-8")
+            rarinfo = self.rar.getinfo(ipath)
+            isdir = _isdir(rarinfo)
         except Exception as err:
             self.em.rclog(
                 "extractone: using_unrar %d rar.getinfo failed: [%s]"
@@ -111,12 +121,14 @@ class RarExtractor(ArchiveExtractor):
             self.em.setmimetype("application/x-fsdirectory")
 
         iseof = rclexecm.RclExecM.noteof
-        if self.currentindex >= len(self.rar.namelist()) - 1:
+        if self.currentindex >= self.lastindex:
             iseof = rclexecm.RclExecM.eofnext
         return (ok, docdata, rclexecm.makebytes(ipath), iseof)
 
     def closefile(self):
         self.rar = None
+        self.namen = []
+        self.lastindex = -1
 
     ###### File type handler api, used by rclexecm ---------->
     def openfile(self, params):
@@ -138,13 +150,16 @@ class RarExtractor(ArchiveExtractor):
                 # binary. Circumvented by passing the open file
                 f = open(filename, "rb")
                 self.rar = RarFile(f)
+            # namelist() builds a new list for each call
+            self.namen = self.rar.namelist()
+            self.lastindex = len(self.namen) - 1
             return True
         except Exception as err:
             self.em.rclog("RarFile: %s" % err)
             return False
 
     def namelist(self):
-        return self.rar.namelist()
+        return self.namen
 
     # getipath from ArchiveExtractor
     # getnext from ArchiveExtractor
@@ -7,6 +7,8 @@
 # bzipped tar-files at well.
 
 import os
+import threading
+import queue
 
 import rclexecm
 from archivextract import ArchiveExtractor
@@ -18,69 +20,175 @@ except:
     sys.exit(1)
 
 
+# The archive is walked in order with tarfile next(), instead of listing all
+# the members when opening it. For a compressed tar, listing means
+# decompressing the whole archive before the first member can be returned.
+#
+# The walk runs in a separate thread, which reads the members ahead of
+# getnext(). The decompression (zlib, bz2 and lzma release the GIL) then
+# overlaps with our parent's processing of the previous document. A
+# compressed tar is a single stream, so there is no point in more threads.
 class TarExtractor(ArchiveExtractor):
     def __init__(self, em):
-        self.namen = []
+        self.tar = None
+        # The walk thread, its output queue and stop flag. The tar object
+        # belongs to the thread while it runs.
+        self.walker = None
+        self.walkqueue = None
+        self.walkstop = None
         super().__init__(em)
 
+    def extract(self, info):
+        if info.size > self.em.maxmembersize:
+            # skip
+            self.em.rclog(
+                "extractone: entry %s size %d too big" % (info.name, info.size)
+            )
+            return b""  # raise TarError("Member too big")
+        with self.tar.extractfile(info) as member:
+            return member.read()
+
+    # Access by name, for getipath()
     def extractone(self, ipath):
+        self._stopwalk()
         docdata = b""
         try:
-            info = self.tar.getmember(ipath)
-            if info.size > self.em.maxmembersize:
-                # skip
-                docdata = b""
-                self.em.rclog(
-                    "extractone: entry %s size %d too big" % (ipath, info.size)
-                )
-                docdata = b""  # raise TarError("Member too big")
-            else:
-                docdata = self.tar.extractfile(ipath).read()
+            docdata = self.extract(self.tar.getmember(ipath))
             ok = True
         except Exception as err:
             ok = False
-        iseof = rclexecm.RclExecM.noteof
-        if self.currentindex >= len(self.namen) - 1:
-            iseof = rclexecm.RclExecM.eofnext
         # We use fsencode, not makebytes, to convert to bytes. The latter would fail if the ipath
         # was actually binary, because it tries to encode to utf-8 but python3 had used fsdecode for
         # converting to str, and the result is not encodable to utf-8 (get: "surrogates
         # not allowed). We use fsdecode in getipath to revert the process.
-        return (ok, docdata, os.fsencode(ipath), iseof)
+        return (ok, docdata, os.fsencode(ipath), rclexecm.RclExecM.noteof)
 
     def closefile(self):
+        self._stopwalk()
         self.tar = None
-        self.namen = []
 
     def openfile(self, params):
+        self.closefile()
         self.currentindex = -1
         filename = params["filename"]
         self.namefilter.setforlocation(filename)
         try:
             self.tar = tarfile.open(name=filename, mode="r")
-            # self.namen = [ y.name for y in filter(lambda z:z.isfile(),self.tar.getmembers())]
-            self.namen = [
-                y.name for y in [z for z in self.tar.getmembers() if z.isfile()]
-            ]
             return True
         except:
             return False
 
     def getipath(self, params):
         ipath = os.fsdecode(params["ipath"])
-        ok, data, ipath, eof = self.extractone(ipath)
-        if ok:
-            return (ok, data, ipath, eof)
+        ret = self.extractone(ipath)
+        if ret[0]:
+            return ret
+        # Maybe the name was decoded as utf-8, not with the file system
+        # encoding. Only retry if this is actually different: a member lookup
+        # is a scan of the whole list.
         try:
-            ipath = ipath.decode("utf-8")
-            return self.extractone(ipath)
+            uipath = params["ipath"].decode("utf-8")
         except Exception as err:
-            return (ok, data, ipath, eof)
+            return ret
+        if uipath == ipath:
+            return ret
+        return self.extractone(uipath)
+
+    # Return the next regular file accepted by the name filter, or None
+    def _nextmember(self):
+        while True:
+            try:
+                info = self.tar.next()
+            except Exception as err:
+                self.em.rclog("tar next() failed: %s" % err)
+                return None
+            if info is None:
+                return None
+            if info.isfile() and self.namefilter.shouldprocess(info.name):
+                return info
+
+    # Walk thread. Queues a first boolean telling if there are any members,
+    # then (info, ok, data, more) for each member, more telling if others
+    # follow. We look for the next member only after reading the current
+    # one's data: going back in a compressed stream means decompressing from
+    # the start. None is queued if the walk ends unexpectedly.
+    #
+    # A member is only read after the previous one was taken from the queue,
+    # so that at most two member buffers exist at a time: the one getnext()
+    # returned, and the one being read here.
+    def _walk(self):
+        done = False
+        try:
+            info = self._nextmember()
+            more = info is not None
+            self.walkqueue.put(more)
+            while more:
+                self.walkqueue.join()
+                if self.walkstop.is_set():
+                    break
+                docdata = b""
+                try:
+                    docdata = self.extract(info)
+                    ok = True
+                except Exception as err:
+                    ok = False
+                nextinfo = self._nextmember()
+                more = nextinfo is not None
+                self.walkqueue.put((info, ok, docdata, more))
+                info = nextinfo
+            done = True
+        finally:
+            if not done and not self.walkstop.is_set():
+                self.walkqueue.put(None)
+
+    def _stopwalk(self):
+        if self.walker is None:
+            return
+        self.walkstop.set()
+        # The thread may be blocked on a full queue, or waiting for the
+        # queued item to be taken
+        while self.walker.is_alive():
+            try:
+                self.walkqueue.get(timeout=0.1)
+                self.walkqueue.task_done()
+            except queue.Empty:
+                pass
+        self.walker = None
+        self.walkqueue = None
+
+    def _getwalk(self):
+        item = self.walkqueue.get()
+        self.walkqueue.task_done()
+        return item
 
-    def namelist(self):
-        return self.namen
+    def getnext(self, params):
+        if self.currentindex == -1:
+            # Return "self" doc
+            self.currentindex = 0
+            self.em.setmimetype("text/plain")
+            self.walkqueue = queue.Queue(maxsize=1)
+            self.walkstop = threading.Event()
+            self.walker = threading.Thread(target=self._walk, daemon=True)
+            self.walker.start()
+            if self._getwalk():
+                eof = rclexecm.RclExecM.noteof
+            else:
+                self.closefile()
+                eof = rclexecm.RclExecM.eofnext
+            return (True, "", "", eof)
+
+        item = self._getwalk() if self.walker else None
+        if item is None:
+            self.closefile()
+            return (False, "", "", rclexecm.RclExecM.eofnow)
 
-    # getnext from ArchiveExtractor
+        info, ok, docdata, more = item
+        self.currentindex += 1
+        iseof = rclexecm.RclExecM.noteof
+        if not more:
+            self.closefile()
+            iseof = rclexecm.RclExecM.eofnext
+        return (ok, docdata, os.fsencode(info.name), iseof)
 
 
 proto = rclexecm.RclExecM()
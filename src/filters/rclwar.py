@@ -14,8 +14,14 @@ class WarExtractor:
         docdata = ""
         iseof = rclexecm.RclExecM.noteof
         try:
-            member = self.tar.extractfile(tarinfo)
-            docdata = member.read()
+            if tarinfo.size > self.em.maxmembersize:
+                self.em.rclog(
+                    "extractone: entry %s size %d too big"
+                    % (tarinfo.name, tarinfo.size)
+                )
+            else:
+                with self.tar.extractfile(tarinfo) as member:
+                    docdata = member.read()
             ok = True
         except Exception as err:
             self.em.rclog("extractone: failed: [%s]" % err)
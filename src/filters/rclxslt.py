@@ -28,10 +28,22 @@ except:
     sys.exit(1)
 
 
+# Compiled transforms, by style sheet text. The filters use a few fixed
+# sheets over many documents (or pages), and compiling a sheet is much
+# more expensive than applying it to a small document.
+_transforms = {}
+
+
+def compile_sheet(sheet):
+    transform = _transforms.get(sheet)
+    if transform is None:
+        transform = etree.XSLT(etree.fromstring(sheet))
+        _transforms[sheet] = transform
+    return transform
+
+
 def _apply_sheet_doc(sheet, doc):
-    styledoc = etree.fromstring(sheet)
-    transform = etree.XSLT(styledoc)
-    return bytes(transform(doc))
+    return bytes(compile_sheet(sheet)(doc))
 
 
 def apply_sheet_data(sheet, data):
@@ -39,6 +51,7 @@ def apply_sheet_data(sheet, data):
     return _apply_sheet_doc(sheet, doc)
 
 
+# fn may also be a binary file object, which lxml reads in chunks.
 def apply_sheet_file(sheet, fn):
     doc = etree.parse(fn)
     return _apply_sheet_doc(sheet, doc)
@@ -19,12 +19,14 @@
 # Zip file extractor for Recoll
 
 import os
-import posixpath
+import struct
 import datetime
 
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED
+from concurrent.futures import ThreadPoolExecutor
 
 import rclexecm
+import cmdtalk
 from archivextract import ArchiveExtractor
 
 
@@ -72,16 +74,28 @@ class ZipExtractor(ArchiveExtractor):
         self.filename = None
         self.f = None
         self.zip = None
+        self.namen = []
+        self.lastindex = -1
+        self.mtimes = {}
+        # When walking the archive, the next member is decompressed in a
+        # worker thread while our parent processes the current one. zlib
+        # releases the GIL while inflating. prefetched is (zipinfo, future)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.prefetched = None
         super().__init__(em)
 
     def closefile(self):
         # self.em.rclog("Closing %s" % self.filename)
+        self._dropprefetch()
         if self.zip:
             self.zip.close()
         if self.f:
             self.f.close()
         self.f = None
         self.zip = None
+        self.namen = []
+        self.lastindex = -1
+        self.mtimes = {}
 
     def extractone(self, ipath):
         # self.em.rclog("extractone: [%s]" % ipath)
@@ -96,28 +110,96 @@ class ZipExtractor(ArchiveExtractor):
                 docdata = ""
                 # raise BadZipfile()
             else:
-                docdata = self.zip.read(ipath)
+                # Note that zipfile stops decompressing at info.file_size,
+                # so a lying header can't make us read more than the limit.
+                docdata = self._storedrange(info) or self._read(info)
             try:
                 # We are assuming here that the zip uses forward slash
                 # separators, which is not necessarily the case. At
                 # worse, we'll get a wrong or no file name, which is
                 # no big deal (the ipath is the important data
-                # element).
-                filename = posixpath.basename(ipath)
+                # element). Same as posixpath.basename(), without the
+                # function call overhead.
+                filename = ipath.rpartition("/")[2]
                 self.em.setfield("filename", filename)
-                dt = datetime.datetime(*info.date_time)
-                self.em.setfield("modificationdate", str(int(dt.timestamp())))
+                self.em.setfield("modificationdate", self.mtime(info.date_time))
             except:
                 pass
             ok = True
         except Exception as err:
             ok = False
         iseof = rclexecm.RclExecM.noteof
-        if self.currentindex >= len(self.zip.namelist()) - 1:
+        if self.currentindex >= self.lastindex:
             self.closefile()
             iseof = rclexecm.RclExecM.eofnext
         return (ok, docdata, rclexecm.makebytes(ipath), iseof)
 
+    # Members often share their dates, and the local time conversion is
+    # comparatively slow: cache the results for the current archive.
+    def mtime(self, date_time):
+        mtime = self.mtimes.get(date_time)
+        if mtime is None:
+            dt = datetime.datetime(*date_time)
+            mtime = self.mtimes[date_time] = str(int(dt.timestamp()))
+        return mtime
+
+    # Reading by ZipInfo spares a second catalog lookup by name
+    def _read(self, info):
+        if self.prefetched and self.prefetched[0] is info:
+            future = self.prefetched[1]
+            self.prefetched = None
+            return future.result()
+        self._dropprefetch()
+        return self.zip.read(info)
+
+    # Stored (uncompressed) members are byte ranges of the archive file: the
+    # data can be sent to our parent directly with sendfile(), without being
+    # read into memory. Returns None if this is not possible for this
+    # member. Note that the CRC is not checked in this case.
+    def _storedrange(self, info):
+        if (
+            not cmdtalk.filerangeok
+            or info.compress_type != ZIP_STORED
+            or info.flag_bits & 0x1
+        ):
+            return None
+        try:
+            fd = self.f.fileno()
+            # The data follows the local header, the name and extra fields
+            # lengths of which may differ from the central directory ones.
+            header = os.pread(fd, 30, info.header_offset)
+            if len(header) != 30 or header[0:4] != b"PK\x03\x04":
+                return None
+            namelen, extralen = struct.unpack("<HH", header[26:30])
+            offset = info.header_offset + 30 + namelen + extralen
+            if offset + info.file_size > os.fstat(fd).st_size:
+                return None
+            return cmdtalk.FileRange(fd, offset, info.file_size)
+        except Exception as err:
+            self.em.rclog("_storedrange: %s" % err)
+            return None
+
+    def _prefetchnext(self):
+        # Same member choice as ArchiveExtractor.getnext()
+        for ipath in self.namen[self.currentindex :]:
+            if self.namefilter.shouldprocess(ipath):
+                break
+        else:
+            return
+        info = self.zip.getinfo(ipath)
+        if info.file_size <= self.em.maxmembersize and not (
+            cmdtalk.filerangeok and info.compress_type == ZIP_STORED
+        ):
+            self.prefetched = (info, self.pool.submit(self.zip.read, info))
+
+    def _dropprefetch(self):
+        if self.prefetched:
+            future = self.prefetched[1]
+            self.prefetched = None
+            # Wait for a running read: we may be closing the zip.
+            if not future.cancel():
+                future.exception()
+
     ###### File type handler api, used by rclexecm ---------->
     def openfile(self, params):
         self.closefile()
@@ -131,16 +213,25 @@ class ZipExtractor(ArchiveExtractor):
             # open file, and open() has no such restriction
             self.f = open(filename, "rb")
             self.zip = ZipFile(self.f)
+            # namelist() builds a new list for each call
+            self.namen = self.zip.namelist()
+            self.lastindex = len(self.namen) - 1
             return True
         except Exception as err:
             self.em.rclog("openfile: failed: [%s]" % err)
             return False
 
     def namelist(self):
-        return self.zip.namelist()
+        return self.namen
+
+    def getnext(self, params):
+        ret = super().getnext(params)
+        if ret[3] == rclexecm.RclExecM.noteof and self.zip:
+            self._dropprefetch()
+            self._prefetchnext()
+        return ret
 
     # getipath from ArchiveExtractor
-    # getnext inherited from ArchiveExtractor
 
 
 # Main program: create protocol handler and extractor and run them
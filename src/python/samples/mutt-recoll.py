@@ -23,16 +23,51 @@ Licensed under BSD
 
 import os
 import hashlib
+import mmap
+import subprocess
 
-from commands import getoutput
 from mailbox import Maildir
 from optparse import OptionParser
-from collections import defaultdict
+from collections import defaultdict, Counter
 
 
-def digest(filename):
-    with open(filename) as f:
-        return hashlib.sha1(f.read()).hexdigest()
+# Only used to find duplicate messages. Hash the mapped file instead of
+# reading it in memory. If maxlen is set, only hash the beginning.
+def digest(filename, maxlen=None):
+    h = hashlib.blake2b(digest_size=20)
+    with open(filename, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm if maxlen is None else mm[:maxlen])
+        except ValueError:
+            # Empty files can't be mapped
+            pass
+    return h.hexdigest()
+
+
+# Size of the file heads which are hashed first when looking for duplicates
+_headlen = 64 * 1024
+
+
+def dupkeys(files):
+    """Return a file->key dict, where identical files have the same key.
+    The key is the file size, extended with the hash of the file head,
+    then of the whole file, only when they are needed to tell files
+    apart. Most messages have a unique size and are not read at all."""
+
+    keys = {}
+    for f in files:
+        try:
+            keys[f] = (os.path.getsize(f),)
+        except OSError:
+            print("File %s does not exist" % f)
+    for maxlen in (_headlen, None):
+        counts = Counter(keys.values())
+        for f, key in keys.items():
+            # The head of a small file is the whole file
+            if counts[key] > 1 and (maxlen or key[0] > _headlen):
+                keys[f] = key + (digest(f, maxlen),)
+    return keys
 
 
 def pick_all_mail(messages):
@@ -46,34 +81,33 @@ def empty_dir(directory):
     box.clear()
 
 
-def command(cmd):
-    return getoutput(cmd)
+def search(query):
+    """Return the paths for the query results. recoll is executed directly,
+    no shell, so the query needs no quoting."""
+    out = subprocess.run(
+        ["recoll", "-t", "--paths-only", "-q", query],
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    # The paths are binary, fsdecode() can revert to the original bytes
+    return [os.fsdecode(f) for f in out.split(b"\n") if f]
 
 
 def main(dest_box, is_gmail):
-    query = raw_input("Query: ")
+    query = input("Query: ")
 
-    command("mkdir -p %s/cur" % dest_box)
-    command("mkdir -p %s/new" % dest_box)
+    os.makedirs(os.path.join(dest_box, "cur"), exist_ok=True)
+    os.makedirs(os.path.join(dest_box, "new"), exist_ok=True)
 
     empty_dir(dest_box)
 
-    files = command("recoll -t -b -q %s" % query).split("\n")
+    files = search(query)
 
     data = defaultdict(list)
     messages = []
 
-    for f in files:
-        # Recoll outputs file:// urls
-        f = f[7:]
-        if not f:
-            continue
-
-        try:
-            sha = digest(f)
-            data[sha].append(f)
-        except IOError:
-            print("File %s does not exist" % f)
+    for f, key in dupkeys(files).items():
+        data[key].append(f)
 
     for sha in data:
         if is_gmail and len(data[sha]) > 1:
@@ -81,14 +115,24 @@ def main(dest_box, is_gmail):
         else:
             messages.append(data[sha][0])
 
-    for m in messages:
-        if not m:
-            continue
-
-        target = os.path.join(dest_box, "cur", os.path.basename(m))
-        if not os.path.exists(target):
-            print("symlink [%s] -> [%s]" % (m, target))
-            os.symlink(m, target)
+    # Create the links relative to an open directory descriptor, so that the
+    # target path is not resolved again for each link. Existing links are
+    # detected by the failure, no separate test.
+    curdir = os.path.join(dest_box, "cur")
+    dirfd = os.open(curdir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        for m in messages:
+            if not m:
+                continue
+
+            name = os.path.basename(m)
+            try:
+                os.symlink(m, name, dir_fd=dirfd)
+            except FileExistsError:
+                continue
+            print("symlink [%s] -> [%s]" % (m, os.path.join(curdir, name)))
+    finally:
+        os.close(dirfd)
 
 
 if __name__ == "__main__":
@@ -70,12 +70,10 @@ def doquery(db, q):
     print("Result count: %d %d" % (nres, query.rowcount))
     if nres > 20:
         nres = 20
-    # results = query.fetchmany(nres)
-    # for doc in results:
 
-    for i in range(nres):
-        doc = query.fetchone()
-        rownum = query.next if type(query.next) == int else query.rownumber
+    # Fetch the batch in one call. The row numbers are counted from 1
+    firstrow = query.rownumber + 1
+    for rownum, doc in enumerate(query.fetchmany(nres), start=firstrow):
         print("%d:" % (rownum,))
 
         # for k,v in doc.items().items():
@@ -84,9 +82,12 @@ def doquery(db, q):
 
         # outfile = extractofile(doc) ; print(f"outfile: {outfile} url: {doc.url}")
 
+        # These are canonical field names, so we can use doc.get() which
+        # does not first try a regular attribute lookup and does not
+        # translate the name. Not doc.items(): it only has the meta
+        # fields (no mtime) and decodes all of them.
         for k in ("title", "mtime", "author"):
-            value = getattr(doc, k)
-            # value = doc.get(k)
+            value = doc.get(k)
             if value is None:
                 print(f"{k}: (None)")
             else:
@@ -23,7 +23,8 @@ for doc in query:
         if fld != 'sig':
             print(f"[{fld}] -> [{getattr(doc, fld)}]")
     print("\nfor k,v in sorted(doc.items().items()):")
-    for k,v in sorted(doc.items().items(), key=lambda itm: itm[0]):
+    # The keys are unique: sorting the pairs sorts by key
+    for k,v in sorted(doc.items().items()):
         # Sig keeps changing and makes it impossible to compare test results
         if k != 'sig':
             print(f"[{k}] -> [{v}]")
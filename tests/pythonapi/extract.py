@@ -1,8 +1,22 @@
 import sys
 import hashlib
+import mmap
 from recoll import recoll
 from recoll import rclextract
 
+def md5file(filename):
+    with open(filename, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            # Python 3.11+: the file is read straight into the hasher
+            return hashlib.file_digest(f, 'md5').hexdigest()
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file, can't be mapped
+            return hashlib.md5().hexdigest()
+        with mm:
+            return hashlib.md5(mm).hexdigest()
+
 db = recoll.connect()
 query = db.query()
 
@@ -16,19 +30,16 @@ print(f"Text length: {len(doc.text)}")
 
 refdigest = 'bfbb63f7a245c31767585b45014dbd07'
 
-# This normally has 2 results, one of which is a pdf attachment.
-nres = query.execute("population_size_cultural_transmission", stemming=0)
+# The term has 2 results, one of which is a pdf attachment. Let the
+# mime: clause select it.
+nres = query.execute("population_size_cultural_transmission mime:application/pdf",
+                     stemming=0)
 for doc in query:
-    if doc.mimetype == 'application/pdf':
-        xtrac = rclextract.Extractor(doc)
-        filename = xtrac.idoctofile(doc.ipath, doc.mimetype)
-        f = open(filename, 'rb')
-        data = f.read()
-        f.close()
-        m = hashlib.md5()
-        m.update(data)
-        digest = m.hexdigest()
-        print(f"{digest}")
-        if digest != refdigest:
-            print("extract.py: wrong digest for extracted file!")
+    xtrac = rclextract.Extractor(doc)
+    filename = xtrac.idoctofile(doc.ipath, doc.mimetype)
+    digest = md5file(filename)
+    print(f"{digest}")
+    if digest != refdigest:
+        sys.exit(f"extract.py: wrong digest {digest} != {refdigest}")
+    break
             
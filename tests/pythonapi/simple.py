@@ -10,15 +10,17 @@ print(f"Xapian query: [{query.getxquery()}]")
 
 print(f"Result count: {nres} {query.rowcount}")
 
+# Collect the names and print them with one call for each pass
 print("for i in range(nres):")
+names = []
 for i in range(nres):
     doc = query.fetchone()
-    print(f"{doc.filename}")
+    names.append(doc.filename)
+print("\n".join(names))
 
 query.scroll(0, 'absolute')
 print("\nfor doc in query:")
-for doc in query:
-    print(f"{doc.filename}")
+print("\n".join([doc.filename for doc in query]))
 
 try:
     query.scroll(0, 'badmode')
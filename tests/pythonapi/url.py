@@ -1,4 +1,5 @@
 import sys
+import os
 from recoll import recoll
 
 # Test the doc.getbinurl() method.
@@ -18,9 +19,14 @@ print(f"Result count: {nres} {query.rowcount}")
 for doc in query:
     print(f"{doc.filename}")
     burl = doc.getbinurl()
-    bytesname = burl[7:]
-    f = open(bytesname, 'rb')
-    s = f.read()
-    f.close()
-    content = str(s, "iso8859-1")
+    assert burl.startswith(b"file://")
+    bytesname = burl[len(b"file://"):]
+    # Small file of known size: read it in one call, without the
+    # buffered file object layer
+    fd = os.open(bytesname, os.O_RDONLY)
+    try:
+        s = os.read(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+    content = s.decode("iso8859-1")
     print(f"Contents: [{content}]")